@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+#
+# Machinery shared by the charu shim (and historically mmmpl).  Nothing
+# here depends on a particular rc prefix: prefix-specific behavior is
+# baked in by build_make_rc(), so that shim modules stay tiny and all
+# caches live in one place.
+
+import atexit
+import contextlib
+import functools
+import math
+import matplotlib
+import matplotlib.pyplot as pyplot
+import operator
+import os
+import shutil
+import subprocess
+import sys
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from matplotlib.ticker import AutoMinorLocator
+from pathlib import Path
+from fractions import Fraction
+
+# Point to inch conversion as Matplotlib only accepts dimensions in
+# inches: 72 pt = 1 inch.
+pt = 1.0 / 72.0
+
+# Golden ratio.
+golden = 1.618033
+
+# rcParams that are not standard.
+WEED_KEYS = frozenset({"figure.widefigsize"})
+
+# Matplotlib's RcParams wraps dict membership tests with validation
+# machinery on some versions, so snapshot the valid keys once.
+_RCPARAM_KEYS = frozenset(pyplot.rcParams)
+
+# Combined LaTeX preambles, interned so that the same fragments always
+# yield the same string object.
+_PREAMBLE_CACHE = {}
+
+# Copying docstrings and deprecation wrappers off pyplot only benefits
+# interactive help(), so skip that import-time work under -O or when
+# CHARU_FAST_IMPORT is set.
+if sys.flags.optimize or os.environ.get("CHARU_FAST_IMPORT"):
+    _copy_doc = lambda src: (lambda func: func)
+else:
+    _copy_doc = pyplot._copy_docstring_and_deprecators
+
+def build_make_rc(prefix, rc_table, misc_keys):
+    """Return a make_rc() specialized for a prefix and its preset table."""
+    # Flat index of the table keyed on (prefix, suffix) so that lookups
+    # skip composite key construction.
+    index = { tuple(key.rsplit(".", 1)): val for key, val in rc_table.items() }
+
+    # The worker tests membership per input key, so a set beats a list.
+    misc_keys = frozenset(misc_keys)
+
+    doc_key = prefix + ".doc"
+    tex_key = prefix + ".tex"
+    wide_key = prefix + ".wide"
+    square_key = prefix + ".square"
+    preamble_key = prefix + ".tex.preamble"
+
+    # Fully-resolved figure-size variants of every doc preset, computed
+    # once so that the worker picks a ready-made dict instead of
+    # swapping figsize keys on every call.
+    doc_variants = {}
+    for (pre, name), preset in index.items():
+        if pre != doc_key:
+            continue
+        for wide in (False, True):
+            for square in (None, 0, 1):
+                variant = dict(preset)
+                if wide and "figure.widefigsize" in variant:
+                    variant["figure.figsize"] = variant["figure.widefigsize"]
+                if square is not None and "figure.figsize" in variant:
+                    size = variant["figure.figsize"]
+                    variant["figure.figsize"] = (size[square], size[square])
+                for key in WEED_KEYS:
+                    variant.pop(key, None)
+                doc_variants[(name, wide, square)] = variant
+
+    @functools.lru_cache(maxsize=128)
+    def _make_rc(frozen):
+        """Memoized worker for make_rc() keyed on frozen rc items."""
+        rc = dict(frozen)
+
+        wide = bool(rc.get(wide_key, False))
+        square = rc.get(square_key)
+        if square not in (None, 0, 1):
+            raise ValueError(f"'{square_key}' must be 0 or 1.")
+
+        # Collect the sub-dicts to merge and fold them together at the
+        # end; a single C-level merge beats many update() calls.
+        parts = []
+        wide_figsize = None
+        for key, val in rc.items():
+            if key in misc_keys or key in _RCPARAM_KEYS:
+                continue
+
+            common = index.get((key, "common"))
+            if common is not None:
+                parts.append(common)
+
+            if key == doc_key:
+                sub = doc_variants.get((str(val), wide, square))
+                if wide and sub is not None:
+                    wide_figsize = index[(key, str(val))].get("figure.widefigsize")
+            else:
+                sub = index.get((key, str(val)))
+            if sub is not None:
+                parts.append(sub)
+            else:
+                raise ValueError(f"'{key}': '{val}' is an invalid rcParam.")
+
+        # Override our settings with actual rc keys if present.
+        parts.append({ key: val for key, val in rc.items() if key in _RCPARAM_KEYS })
+
+        if rc.get(tex_key, False):
+            parts.append(rc_table[tex_key])
+
+        true_rc = functools.reduce(operator.ior, parts, {})
+
+        # The doc variants are already wide/square as needed, but
+        # explicit figure.figsize overrides still have to be handled:
+        # the wide size beats an override (as it always has), and
+        # squaring applies to whatever ends up as the figure size.
+        if wide_figsize is not None:
+            true_rc["figure.figsize"] = wide_figsize
+
+        if square is not None and "figure.figsize" in true_rc:
+            size = true_rc["figure.figsize"]
+            true_rc["figure.figsize"] = (size[square], size[square])
+
+        # Append LaTeX preamble if any.
+        base = true_rc.get("text.latex.preamble", "")
+        extra = rc.get(preamble_key, "")
+        preamble = _PREAMBLE_CACHE.setdefault((base, extra), sys.intern(base + extra))
+        true_rc.update({ "text.latex.preamble": preamble })
+
+        for key in WEED_KEYS:
+            true_rc.pop(key, None)
+
+        return true_rc
+
+    def make_rc(rc):
+        """Function to make valid rcParams from supplied ones."""
+        # Freeze the items as a tuple -- not a frozenset, since presets
+        # must merge in the caller's key order -- turning lists (e.g.,
+        # figure.figsize) into tuples so that they hash.
+        frozen = tuple(
+            (key, tuple(val) if isinstance(val, list) else val) for key, val in rc.items()
+        )
+        try:
+            return dict(_make_rc(frozen))
+        except TypeError:
+            # Values like cycler objects (axes.prop_cycle) are not
+            # hashable; skip the cache for those calls.
+            return dict(_make_rc.__wrapped__(frozen))
+
+    return make_rc
+
+def install_rc_context(make_rc):
+    """Monkey-patch pyplot.rc_context() to understand make_rc's keys."""
+    @_copy_doc(pyplot.rc_context)
+    def rc_context(rc=None, fname=None):
+        if rc:
+            rc = make_rc(rc)
+
+        return matplotlib.rc_context(rc, fname)
+
+    pyplot.rc_context = rc_context
+    return rc_context
+
+class ExecutableNotFound(Warning):
+    pass
+
+# Don't print Python code during warnings.
+_fmtwarn = warnings.formatwarning
+fmtwarn = lambda *args, line=None: _fmtwarn(*(args[:-1]), line="")
+
+def _warn_missing(tool):
+    """Warn that a tool is not in the path.
+
+    The format override is scoped to this warning instead of clobbering
+    the user's global warning state.  Note that
+    warnings.catch_warnings() does not restore formatwarning.
+    """
+    saved = warnings.formatwarning
+    warnings.formatwarning = fmtwarn
+    try:
+        warnings.warn(f"{tool} not in path, skipping", ExecutableNotFound)
+    finally:
+        warnings.formatwarning = saved
+
+@functools.lru_cache(maxsize=None)
+def _which(tool):
+    """Memoized shutil.which() membership test."""
+    return shutil.which(tool) is not None
+
+@functools.lru_cache(maxsize=None)
+def _have(tool):
+    """Like _which(), but warn the first time a tool comes up missing."""
+    if _which(tool):
+        return True
+    _warn_missing(tool)
+    return False
+
+def execute(*args, **kwargs):
+    """Run an executable, but suppress its output."""
+    try:
+        return subprocess.run(
+            *args,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            **kwargs,
+        )
+    except FileNotFoundError:
+        _warn_missing(args[0][0])
+
+# Pending crop/optimize jobs running in the background.  The tools that
+# work on a single figure mutate the file in place and must run one
+# after the other, but jobs for distinct figures can overlap.
+_PENDING = []
+_pool = None
+
+def _submit(func, *args):
+    """Run func(*args) in the background and remember its future."""
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor()
+    _PENDING.append(_pool.submit(func, *args))
+
+def wait():
+    """Block until all pending crop/optimize jobs have finished."""
+    while _PENDING:
+        _PENDING.pop().result()
+
+# Figures still being post-processed when the script ends would
+# otherwise be left half-written.
+atexit.register(wait)
+
+def _qpdf(name):
+    """Linearize a PDF in place through a temporary file."""
+    tmp = "{}.tmp".format(name)
+    if execute(["qpdf", "--linearize", "--object-streams=generate", name, tmp]):
+        Path(tmp).replace(name)
+
+# The planners run in the calling thread so that the missing-tool
+# warnings in _have() never touch warning state from a worker; only the
+# returned steps run in the background.
+def _plan_pdf(name, crop, optimize):
+    """Plan the steps that crop and optimize a saved PDF in place."""
+    steps = []
+    if crop and _have("pdfcrop"):
+        steps.append(lambda: execute(["pdfcrop", "--pdfversion", "none", name, name]))
+    if optimize == "max":
+        # pdfsizeopt squeezes out the most bytes, but takes seconds
+        # per figure; reserve it for final document builds.
+        if _have("pdfsizeopt"):
+            steps.append(lambda: execute([
+                "pdfsizeopt",
+                "--quiet",
+                "--do-optimize-images=no",
+                name,
+                name,
+            ]))
+    elif optimize and _have("qpdf"):
+        steps.append(lambda: _qpdf(name))
+    return steps
+
+def _plan_png(name, crop, optimize):
+    """Plan the steps that crop and optimize a saved PNG in place."""
+    steps = []
+    if crop and _have("mogrify"):
+        steps.append(lambda: execute(["mogrify", "-trim", name]))
+    if optimize:
+        if _which("oxipng"):
+            steps.append(lambda: execute(["oxipng", "-o", "2", "-i", "0", "--strip", "safe", name]))
+        elif _have("optipng"):
+            steps.append(lambda: execute(["optipng", "-o1", "-clobber", "-quiet", name]))
+    return steps
+
+_POSTPROCESS = {
+    ".pdf": _plan_pdf,
+    ".png": _plan_png,
+}
+
+def _run_steps(steps):
+    """Run the planned post-processing steps one after the other."""
+    for step in steps:
+        step()
+
+# Draft mode for quick iteration: savefig() skips cropping and
+# optimization and drops to screen resolution.
+DRAFT = bool(os.environ.get("CHARU_DRAFT"))
+
+def draft(enable=True):
+    """Turn draft mode on (or off) for subsequent savefig() calls.
+
+    Assigning to the DRAFT attribute of a shim module like charu only
+    shadows the name there, so use this instead.
+    """
+    global DRAFT
+    DRAFT = bool(enable)
+
+@contextlib.contextmanager
+def final():
+    """Temporarily leave draft mode, e.g., around the finished figure."""
+    global DRAFT
+    saved, DRAFT = DRAFT, False
+    try:
+        yield
+    finally:
+        DRAFT = saved
+
+@_copy_doc(pyplot.savefig)
+def savefig(name, crop=False, optimize=False, **kwargs):
+    """Monkey-patched pyplot.savefig() with cropping and optimization.
+
+    Pass optimize="max" for the slower, more aggressive optimizers.
+    """
+    if DRAFT:
+        crop = optimize = False
+        kwargs.setdefault("dpi", 100)
+
+    _savefig(name, **kwargs)
+
+    # The common case asks for no post-processing; skip the stat calls.
+    if not (crop or optimize):
+        return
+
+    p = Path(name)
+    planner = _POSTPROCESS.get(p.suffix.lower())
+    if planner is not None and p.is_file():
+        steps = planner(name, crop, optimize)
+        if steps:
+            _submit(_run_steps, steps)
+
+_savefig = pyplot.savefig
+pyplot.savefig = savefig
+
+# By default, Matplotlib uses 5 minor ticks between major ticks if the
+# number of ticks are not supplied.  But we like 4 ticks.
+@_copy_doc(AutoMinorLocator)
+class MinorLocator(AutoMinorLocator):
+    def __init__(self, n=4):
+        super().__init__(n=n)
+
+matplotlib.ticker.AutoMinorLocator = MinorLocator
+
+# Better 3D axes.  mpl_toolkits is heavy, so the class is only created
+# (and its projection registered) on first use.
+_axes3dx = None
+
+def _register_3dx():
+    """Create and register the Axes3Dx projection on first use."""
+    global _axes3dx
+    if _axes3dx is not None:
+        return _axes3dx
+
+    import mpl_toolkits.mplot3d
+
+    class Axes3Dx(mpl_toolkits.mplot3d.axes3d.Axes3D):
+        name = "3dx"
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.grid(True)
+            self.patch.set_alpha(0)
+
+            # Tweaks for all axes.
+            for axis in (self.xaxis, self.yaxis, self.zaxis):
+                axis._axinfo["tick"].update({ "inward_factor": 0, "outward_factor": 0.25 })
+                axis.pane.fill = False
+                axis.set_rotate_label(False)
+
+            # Tweaks for x and y axes.
+            for axis in (self.xaxis, self.yaxis):
+                axis.pane.set_edgecolor("black")
+                axis.pane.set_linewidth(matplotlib.rcParams["axes.linewidth"])
+
+            # Tweaks just for the zaxis.
+            self.zaxis._axinfo.update({
+                # Use this to reposition the spine of a particular axis.  This is an
+                # undocumented part of the Matplotlib API and may break any time.
+                # In fact, the conventions have changed from the time of this 2018
+                # StackOverflow answer: https://stackoverflow.com/a/49601745
+                "juggled": (1, 2, 1),
+                # Align the ticks along the y axis.
+                "tickdir": 1,
+            })
+
+        # Right align z labels because now the z axis is on the left.
+        def set_zticklabels(self, labels, ha="right", **kwargs):
+            return super().set_zticklabels(labels, ha=ha, **kwargs)
+
+    matplotlib.projections.register_projection(Axes3Dx)
+    _axes3dx = Axes3Dx
+    return Axes3Dx
+
+# PEP 562: resolve Axes3Dx lazily so that 2D-only scripts never pay for
+# the 3D stack.
+def __getattr__(name):
+    if name == "Axes3Dx":
+        return _register_3dx()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Hook projection lookup so that asking for projection="3dx" triggers
+# registration; this is what add_subplot() and friends go through.
+_get_projection_class = matplotlib.projections.get_projection_class
+
+def get_projection_class(projection=None):
+    if projection == "3dx":
+        _register_3dx()
+    return _get_projection_class(projection)
+
+matplotlib.projections.get_projection_class = get_projection_class
+
+def ticklabels(start, stop, num=10, div=1, divstr=None, digits=5):
+    """Return evenly spaced fractional ticks and labels over an interval."""
+    a, b = Fraction(round(start / div, digits)), Fraction(round(stop / div, digits))
+    step = (b-a) / (num-1)
+
+    # The ticks are just a linear schedule, so compute them in one go as
+    # an array; only the labels need Fraction arithmetic.  NumPy is
+    # imported here so that merely importing us does not pull it in.
+    try:
+        import numpy as np
+    except ImportError:
+        ticks = [div * (float(a) + i * float(step)) for i in range(num)]
+    else:
+        ticks = div * (float(a) + np.arange(num) * float(step))
+
+    # Every tick is a + i*step, so over the common denominator D the
+    # numerators form an arithmetic progression.  Walking that
+    # progression costs a single gcd per tick instead of the repeated
+    # normalization that Fraction addition would do.
+    D = a.denominator * step.denominator // math.gcd(a.denominator, step.denominator)
+    n0 = a.numerator * (D // a.denominator)
+    dn = step.numerator * (D // step.denominator)
+
+    pairs = []
+    for i in range(num):
+        n = n0 + i*dn
+        g = math.gcd(n, D)
+        pairs.append((n // g, D // g))
+
+    if divstr is None:
+        return ticks, [f"${n}$" if d == 1 else f"${n}/{d}$" for n, d in pairs]
+
+    # Label templates keyed on a 4-bit mask of the fraction's shape:
+    # (numerator zero) << 3 | (|numerator| one) << 2 | (denominator
+    # one) << 1 | (negative).  This bakes divstr in once and replaces
+    # the old if/elif ladder with a dict lookup per tick.  LaTeX braces
+    # in divstr (e.g., \omega_{0}) must not look like format fields.
+    divstr = divstr.replace("{", "{{").replace("}", "}}")
+    fmts = {
+        0b1010: "$0$",
+        0b0110: f"${divstr}$",
+        0b0111: f"$-{divstr}$",
+        0b0010: f"${{n}}{divstr}$",
+        0b0011: f"${{n}}{divstr}$",
+        0b0100: f"${divstr}/{{d}}$",
+        0b0101: f"$-{divstr}/{{d}}$",
+        0b0000: f"${{n}}{divstr}/{{d}}$",
+        0b0001: f"${{n}}{divstr}/{{d}}$",
+    }
+
+    labels = []
+    for n, d in pairs:
+        mask = ((n == 0) << 3) | ((abs(n) == 1) << 2) | ((d == 1) << 1) | (n < 0)
+        labels.append(fmts[mask].format(n=n, d=d))
+
+    return ticks, labels